@@ -17,8 +17,8 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import time
-from logger import Logger
+import cmd
+from logger import Logger, timestamp
 from typing import List, Optional, Tuple
 
 
@@ -34,61 +34,71 @@ def _print_cmd_help():
     )
 
 
-class Console(Logger):
+class _Shell(cmd.Cmd):
+    """Interpret the commands typed at the console prompt."""
 
-    # Implement the Logger interface.
-    def log(self, s: str):
-        print("%s: %s" % (time.strftime("%Y-%m-%d %H:%M:%S"), s))
+    prompt = "> "
 
-    def request_loop(self, *, init_fn):
-        # Wait for the system to init before proceeding further
-        systems = init_fn()
+    def __init__(self, systems, *, logger: Logger):
+        # cmdloop() enables readline line editing and history, where
+        # available
+        super().__init__()
+        self._systems = systems
+        self._logger = logger
 
-        print("")
-        print("Input your commands at the prompt, '?' for help")
-        while True:
-            try:
-                cmd_tokens = input("> ").lower().split()
-            except KeyboardInterrupt:
-                # Ctrl+C
-                break
-            except EOFError:
-                # Ctrl+D
-                break
-
-            if len(cmd_tokens) == 0:
-                # Empty command
-                _print_cmd_help()
-                continue
+    def precmd(self, line: str) -> str:
+        # Commands are case-insensitive, but their parameters (e.g. file
+        # names) are passed along untouched.
+        tokens = line.split(maxsplit=1)
+        if len(tokens) == 0:
+            return line
+        tokens[0] = tokens[0].lower()
+        return " ".join(tokens)
 
-            cmd = cmd_tokens[0]
-            if cmd == "?" or cmd == "h" or cmd == "help":
+    def emptyline(self):
+        # Empty command
+        _print_cmd_help()
+
+    def default(self, line: str):
+        # Unrecognized command
+        _print_cmd_help()
+
+    def do_help(self, arg: str):
+        _print_cmd_help()
+
+    do_h = do_help
+
+    def do_display(self, arg: str):
+        self._systems.display()
+
+    def do_save(self, arg: str):
+        cmd_parameters = arg.split()
+        if len(cmd_parameters) != 1:
+            _print_cmd_help()
+        else:
+            self._systems.save(cmd_parameters[0])
+
+    def do_zoom(self, arg: str):
+        cmd_parameters = arg.split()
+        if len(cmd_parameters) == 0:
+            # Exact match on the 'zoom' command: zoom out
+            self._systems.zoom_out()
+        elif len(cmd_parameters) == 2:
+            # 'zoom' command + 2 parameters: this is a zoom in
+            coordinates = self._parse_coordinates(cmd_parameters)
+            if coordinates is None:
                 _print_cmd_help()
-            elif cmd == "display":
-                systems.display()
-            elif cmd == "save" and len(cmd_tokens) == 2:
-                systems.save(cmd_tokens[1])
-            elif cmd == "zoom":
-                if len(cmd_tokens) == 1:
-                    # Exact match on the 'zoom' command: zoom out
-                    systems.zoom_out()
-                elif len(cmd_tokens) == 3:
-                    # 'zoom' command + 2 parameters: this is a zoom in
-                    coordinates = self._parse_coordinates(cmd_tokens[1:])
-                    if coordinates is None:
-                        _print_cmd_help()
-                    else:
-                        systems.zoom_in(coordinates[0], coordinates[1])
-                else:
-                    # Wrong number of parameters
-                    _print_cmd_help()
-            elif cmd == "exit":
-                break
             else:
-                # Unrecognized command
-                _print_cmd_help()
+                self._systems.zoom_in(coordinates[0], coordinates[1])
+        else:
+            # Wrong number of parameters
+            _print_cmd_help()
 
-        print("Exiting...")
+    def do_exit(self, arg: str):
+        return True
+
+    # Ctrl+D
+    do_eof = do_exit
 
     def _parse_coordinates(
         self, cmd_parameters: List[str]
@@ -98,11 +108,11 @@ class Console(Logger):
 
         first = cmd_parameters[0].split(",")
         if len(first) != 2:
-            self.log("First coordinate in bad format: %s" % cmd_parameters[0])
+            self._logger.log("First coordinate in bad format: %s" % cmd_parameters[0])
             return None
         second = cmd_parameters[1].split(",")
         if len(second) != 2:
-            self.log("Second coordinate in bad format: %s" % cmd_parameters[1])
+            self._logger.log("Second coordinate in bad format: %s" % cmd_parameters[1])
             return None
 
         try:
@@ -110,7 +120,29 @@ class Console(Logger):
             z_0 = int(first[1])
             x_1 = int(second[0])
             z_1 = int(second[1])
-        except Exception as e:
-            self.log("Parse error: %s" % e)
+        except ValueError as e:
+            self._logger.log("Parse error: %s" % e)
             return None
         return [(x_0, z_0), (x_1, z_1)]
+
+
+class Console(Logger):
+
+    # Implement the Logger interface.
+    def log(self, s: str):
+        print(f"{timestamp()}: {s}")
+
+    def request_loop(self, *, init_fn):
+        # Wait for the system to init before proceeding further
+        systems = init_fn()
+
+        print("")
+        try:
+            _Shell(systems, logger=self).cmdloop(
+                "Input your commands at the prompt, '?' for help"
+            )
+        except KeyboardInterrupt:
+            # Ctrl+C
+            pass
+
+        print("Exiting...")
@@ -19,21 +19,26 @@
 
 import functools
 import os
+import queue
 import re
 import threading
-import time
 import tkinter
 import traceback
-from logger import Logger
+from logger import Logger, timestamp
 from tkinter import filedialog, ttk
 from typing import List, Optional, Tuple
 
+# How often logged messages are moved to the status bar
+_LOG_DRAIN_INTERVAL_MS = 50
+
 
 class GUI(Logger):
 
     def __init__(self):
         # This will be set when the main window is first displayed
         self._status_text = None
+        # Log messages waiting to be shown in the status bar
+        self._log_queue = queue.Queue()
         # Separate thread where long-operations are offloaded to
         self._longop_thread = None
         # This will be set when the main request loop is called
@@ -117,17 +122,33 @@ class GUI(Logger):
         ).grid(column=1, row=7, columnspan=2, sticky=(tkinter.W, tkinter.E))
 
         # Setup padding for all children of the mainframe
-        for child in self._mainframe.winfo_children():
+        children = self._mainframe.winfo_children()
+        for child in children:
             child.grid_configure(padx=5, pady=5)
+        # Remember all buttons, to enable/disable them around long ops
+        self._buttons = tuple(c for c in children if isinstance(c, ttk.Button))
 
         self.log("Main window ready")
 
     # Implement the Logger interface.
     def log(self, s: str):
-        msg = "%s: %s" % (time.strftime("%Y-%m-%d %H:%M:%S"), s)
+        msg = f"{timestamp()}: {s}"
         print(msg)
-        if self._status_text is not None:
+        # This may be called from the long op thread: leave updating the
+        # status bar to the main loop (see _drain_log_queue).
+        self._log_queue.put(msg)
+
+    def _drain_log_queue(self):
+        """Show the latest logged message in the status bar."""
+        msg = None
+        try:
+            while True:
+                msg = self._log_queue.get_nowait()
+        except queue.Empty:
+            pass
+        if msg is not None:
             self._status_text.set(msg)
+        self._root.after(_LOG_DRAIN_INTERVAL_MS, self._drain_log_queue)
 
     def _handle_display(self, *args):
         self._systems.display()
@@ -141,13 +162,9 @@ class GUI(Logger):
     def _handle_zoom_in(self, *args):
         try:
             coord0 = (int(self.x0.get()), int(self.z0.get()))
-        except ValueError as e:
-            self.log("Error parsing first coordinate: %s" % e)
-            return
-        try:
             coord1 = (int(self.x1.get()), int(self.z1.get()))
         except ValueError as e:
-            self.log("Error parsing second coordinate: %s" % e)
+            self.log("Error parsing coordinates: %s" % e)
             return
 
         self._systems.zoom_in(coord0, coord1)
@@ -205,9 +222,8 @@ class GUI(Logger):
         self._progressbar.grid_remove()
 
     def _buttons_change_state(self, state):
-        for child in self._mainframe.winfo_children():
-            if isinstance(child, ttk.Button):
-                child["state"] = state
+        for button in self._buttons:
+            button["state"] = state
 
     def _long_op_pre(self):
         """Prepare for a long op"""
@@ -256,6 +272,7 @@ class GUI(Logger):
 
         # Setup main window
         self._setup_window()
+        self._root.after(_LOG_DRAIN_INTERVAL_MS, self._drain_log_queue)
 
         # Handle the system initialization like a long operation
         self._handle_long_op(systems_init)
@@ -17,6 +17,26 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import time
+
+# Last formatted timestamp, as a (seconds since epoch, string) tuple
+_last_timestamp = (0, "")
+
+
+def timestamp() -> str:
+    """Return the current local time, formatted for log messages.
+
+    The formatted string is cached, and only recomputed when the
+    current second changes."""
+    global _last_timestamp
+    # Read the cache only once: it might be replaced by another thread
+    last = _last_timestamp
+    now = int(time.time())
+    if now != last[0]:
+        last = (now, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)))
+        _last_timestamp = last
+    return last[1]
+
 
 class Logger:
     """Abstract base class to implement a logger sink."""
@@ -18,25 +18,101 @@
 #
 
 import argparse
-import gzip
-import json
+import array
+import ijson
+import numpy as np
+import os
 from console import Console
 from gui import GUI
 from logger import Logger
 from systems import Systems
+from typing import Iterator, Tuple
 
+try:
+    # ISA-L's gzip implementation is a drop-in, and much faster,
+    # replacement for the standard one
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
 
-def parse_json(input_file: str, logger: Logger):
+
+def parse_json(input_file: str, logger: Logger) -> Iterator[dict]:
+    """Iterate over all systems in the input file.
+
+    The file is parsed incrementally, one system at a time, so that the
+    whole dump is never held in memory."""
     logger.log("Parsing input file %s..." % input_file)
-    try:
-        with gzip.open(input_file, "r") as fp:
-            jdata = json.load(fp)
-    except gzip.BadGzipFile:
-        with open(input_file, "r") as fp:
-            jdata = json.load(fp)
+    with open(input_file, "rb") as fp:
+        # Decompress the file on the fly if it starts with the gzip
+        # magic number
+        compressed = fp.read(2) == b"\x1f\x8b"
+        fp.seek(0)
+        with gzip.open(fp) if compressed else fp as stream:
+            yield from ijson.items(stream, "item", use_float=True)
 
     logger.log("Input file parsed correctly")
-    return jdata
+
+
+def extract_neutron_stars(
+    systems: Iterator[dict], logger: Logger
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the x and z coordinates of all Neutron Star systems.
+
+    Only systems where the *main* star is a Neutron Star are kept, and
+    only their x and z coordinates: this is all the heatmap needs."""
+    xs = array.array("f")
+    zs = array.array("f")
+    for system in systems:
+        if system.get("mainStar") == "Neutron Star":
+            coords = system["coords"]
+            xs.append(coords["x"])
+            zs.append(coords["z"])
+    logger.log("Found %d Neutron Star systems" % len(xs))
+    return np.frombuffer(xs, dtype=np.float32), np.frombuffer(zs, dtype=np.float32)
+
+
+def load_neutron_stars(
+    input_file: str, logger: Logger
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the x and z coordinates of all Neutron Star systems.
+
+    The coordinates are cached next to the input file, keyed by its
+    modification time and size, so that the JSON dump is only parsed
+    once per version of the file."""
+    stat = os.stat(input_file)
+    cache_file = "%s.%d.%d.neutron.npz" % (
+        input_file,
+        stat.st_mtime_ns,
+        stat.st_size,
+    )
+    try:
+        with np.load(cache_file) as cache:
+            xs, zs = cache["xs"], cache["zs"]
+        logger.log("Loaded Neutron Star systems from cache %s" % cache_file)
+        return xs, zs
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # A damaged cache is no worse than a missing one
+        logger.log("Ignoring unreadable cache %s: %s" % (cache_file, e))
+
+    xs, zs = extract_neutron_stars(parse_json(input_file, logger), logger)
+
+    # Write to a temporary file first, so that an interrupted run never
+    # leaves a truncated cache behind.
+    tmp_file = cache_file + ".tmp"
+    try:
+        with open(tmp_file, "wb") as fp:
+            np.savez(fp, xs=xs, zs=zs)
+        os.replace(tmp_file, cache_file)
+        logger.log("Neutron Star systems cached to %s" % cache_file)
+    except OSError as e:
+        logger.log("Unable to write cache %s: %s" % (cache_file, e))
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+    return xs, zs
 
 
 def choose_control(control: str):
@@ -47,14 +123,14 @@ def choose_control(control: str):
     raise ValueError("Application bug: unexpected control: %s" % control)
 
 
-def main(input_file: str, control: str):
+def main(input_file: str, control: str, gpu: bool):
     # Initialize environment.
     control = choose_control(control)
 
     def init_systems() -> Systems:
-        jdata = parse_json(input_file, control)
+        xs, zs = load_neutron_stars(input_file, control)
         # Import systems data in the database
-        return Systems(jdata, logger=control)
+        return Systems(xs, zs, logger=control, use_gpu=gpu)
 
     # Handle the interactive request loop
     control.request_loop(init_fn=init_systems)
@@ -76,5 +152,10 @@ if __name__ == "__main__":
         default="console",
         help="preferred method to control the inputs",
     )
+    parser.add_argument(
+        "--gpu",
+        action="store_true",
+        help="bin heatmaps on a CUDA GPU (requires CuPy)",
+    )
     args = parser.parse_args()
-    main(args.input, args.control)
+    main(args.input, args.control, args.gpu)
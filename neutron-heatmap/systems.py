@@ -17,50 +17,243 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import pandas as pd
+import numpy as np
 import plotly.express as px
 from logger import Logger
 from typing import Tuple
 
+try:
+    import numba
+except ImportError:
+    # numba is optional: plain numpy kernels are used without it
+    numba = None
+
+# Harcoded number of X and Y bins to avoid rendering charts too large
+_HEATMAP_BINS = 1000
+
+# Coordinates are quantized to 1 ly cells, as unsigned 32-bit integers,
+# to compute their Z-order (Morton) code.
+_QUANTIZED_MAX = 2**32 - 1
+
+
+def _spread_bits(v):
+    """Move the lower 32 bits of each uint64 value to its even bits."""
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def _morton_encode(qx: np.ndarray, qz: np.ndarray) -> np.ndarray:
+    """Interleave the bits of quantized (uint64) x and z coordinates."""
+    return _spread_bits(qx) | (_spread_bits(qz) << np.uint64(1))
+
+
+def _bbox_mask(xs, zs, min_x, max_x, min_z, max_z) -> np.ndarray:
+    """Return which coordinates lie strictly inside the bounding box."""
+    return (xs > min_x) & (xs < max_x) & (zs > min_z) & (zs < max_z)
+
+
+if numba is not None:
+    # Both kernels are simple element-wise loops over arrays: compile them,
+    # and spread them over all available cores.
+    _spread_bits_jit = numba.njit(cache=True)(_spread_bits)
+
+    @numba.njit(parallel=True, cache=True)
+    def _morton_encode_kernel(qx, qz, out):
+        for i in numba.prange(qx.size):
+            out[i] = _spread_bits_jit(qx[i]) | (_spread_bits_jit(qz[i]) << np.uint64(1))
+
+    @numba.njit(parallel=True, cache=True)
+    def _bbox_mask_kernel(xs, zs, min_x, max_x, min_z, max_z, out):
+        for i in numba.prange(xs.size):
+            out[i] = min_x < xs[i] < max_x and min_z < zs[i] < max_z
+
+    def _morton_encode(qx: np.ndarray, qz: np.ndarray) -> np.ndarray:
+        out = np.empty(qx.shape, dtype=np.uint64)
+        _morton_encode_kernel(qx, qz, out)
+        return out
+
+    def _bbox_mask(xs, zs, min_x, max_x, min_z, max_z) -> np.ndarray:
+        out = np.empty(xs.shape, dtype=np.bool_)
+        _bbox_mask_kernel(xs, zs, min_x, max_x, min_z, max_z, out)
+        return out
+
+
+def _data_range(xs: np.ndarray, zs: np.ndarray) -> Tuple[float, float, float, float]:
+    """Return the (min x, max x, min z, max z) range of the provided systems."""
+    if xs.size == 0:
+        return (0.0, 0.0, 0.0, 0.0)
+    return (float(xs.min()), float(xs.max()), float(zs.min()), float(zs.max()))
+
+
+def _bin_centers(edges: np.ndarray) -> np.ndarray:
+    return (edges[:-1] + edges[1:]) / 2
+
 
 class Systems:
 
-    def __init__(self, json_data, *, logger: Logger):
+    def __init__(
+        self, xs: np.ndarray, zs: np.ndarray, *, logger: Logger, use_gpu: bool = False
+    ):
+        """Initialize from the x and z coordinates of all Neutron Star systems.
+
+        If use_gpu is set, and CuPy is available, heatmaps are binned on
+        a CUDA GPU."""
         self._logger = logger
 
-        # Normalize the JSON structure, but expanding the nested "coords"
-        # object to a top-level object.
-        self._logger.log("Normalizing data...")
-        normalized_data = pd.json_normalize(json_data)
-        # Only keep systems where the *main* star is a Neutron Star.
         self._logger.log("Initializing database...")
-        self._all_systems = normalized_data.query("mainStar == 'Neutron Star'")
-        # Select all systems by default
-        self._selected_systems = self._all_systems
+        # Galactic coordinates fit comfortably in single precision, which
+        # halves the memory scanned by every zoom and heatmap.
+        xs = xs.astype(np.float32, copy=False)
+        zs = zs.astype(np.float32, copy=False)
+        # Range covered by all systems, used to bin the heatmap
+        self._all_range = _data_range(xs, zs)
+        # Sort all systems by the Z-order code of their coordinates:
+        # all systems within a bounding box then lie between the codes
+        # of its two opposite corners, so a zoom in only needs to scan
+        # that range rather than the whole database.
+        self._origin = (self._all_range[0], self._all_range[2])
+        zorder = self._zorder_code(xs, zs)
+        order = np.argsort(zorder)
+        self._zorder = zorder[order]
+        # Coordinates of all systems, in Z-order
+        self._all_xs = xs[order]
+        self._all_zs = zs[order]
+        # The selected systems are the ones in the _selected_slice range
+        # (in Z-order) for which _selected_mask is True; a mask of None
+        # selects the whole range. Select all systems by default.
+        self._selected_slice = slice(None)
+        self._selected_mask = None
+        self._selected_range = self._all_range
+        # Heatmap of the selected systems, built on first use
+        self._figure = None
+        # Copy all coordinates to the GPU once, if requested
+        self._cupy = None
+        if use_gpu:
+            self._setup_gpu()
         self._logger.log("Database initialized")
 
+    def _setup_gpu(self):
+        try:
+            import cupy
+        except ImportError:
+            self._logger.log("CuPy is not available, heatmaps will be binned on CPU")
+            return
+
+        self._logger.log("Copying systems to GPU...")
+        try:
+            gpu_xs = cupy.asarray(self._all_xs)
+            gpu_zs = cupy.asarray(self._all_zs)
+        except Exception as e:
+            # No usable CUDA device, not enough device memory, ...:
+            # binning on CPU is always an option.
+            self._logger.log("%s, heatmaps will be binned on CPU" % e)
+            return
+        self._gpu_xs = gpu_xs
+        self._gpu_zs = gpu_zs
+        self._cupy = cupy
+
+    def _zorder_code(self, xs, zs) -> np.ndarray:
+        """Return the Z-order code of the provided coordinates.
+
+        Coordinates are quantized relative to the database origin, so
+        that the code is monotonic in both x and z. This is done in
+        double precision, so that rounding can never push a system out
+        of the Z-order range of a bounding box that contains it."""
+        xs = np.asarray(xs, dtype=np.float64)
+        zs = np.asarray(zs, dtype=np.float64)
+        qx = np.clip(np.floor(xs - self._origin[0]), 0, _QUANTIZED_MAX)
+        qz = np.clip(np.floor(zs - self._origin[1]), 0, _QUANTIZED_MAX)
+        return _morton_encode(qx.astype(np.uint64), qz.astype(np.uint64))
+
+    def _selected_coordinates(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the x and z coordinates of the selected systems."""
+        # Slicing only creates views: data is copied only if a mask is set
+        xs = self._all_xs[self._selected_slice]
+        zs = self._all_zs[self._selected_slice]
+        if self._selected_mask is not None:
+            xs = xs[self._selected_mask]
+            zs = zs[self._selected_mask]
+        return xs, zs
+
+    def _histogram(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Bin the selected systems, like np.histogram2d."""
+        min_x, max_x, min_z, max_z = self._selected_range
+        bins = [_HEATMAP_BINS, _HEATMAP_BINS]
+        bins_range = [[min_x, max_x], [min_z, max_z]]
+        if self._cupy is None:
+            xs, zs = self._selected_coordinates()
+            return np.histogram2d(xs, zs, bins=bins, range=bins_range)
+
+        # Same selection as _selected_coordinates(), on the GPU copy
+        cupy = self._cupy
+        xs = self._gpu_xs[self._selected_slice]
+        zs = self._gpu_zs[self._selected_slice]
+        if self._selected_mask is not None:
+            mask = cupy.asarray(self._selected_mask)
+            xs = xs[mask]
+            zs = zs[mask]
+        counts, x_edges, z_edges = cupy.histogram2d(xs, zs, bins=bins, range=bins_range)
+        return cupy.asnumpy(counts), cupy.asnumpy(x_edges), cupy.asnumpy(z_edges)
+
+    def _heatmap(self):
+        # Reuse the last heatmap if the selection did not change since
+        if self._figure is None:
+            self._figure = self._build_heatmap()
+        return self._figure
+
+    def _build_heatmap(self):
+        # Bin the selected systems here, so that the figure only carries
+        # the bin counts rather than every single system.
+        counts, x_edges, z_edges = self._histogram()
+        # Log-scale the counts and quantize them to 8 bits: this is
+        # plenty for a color scale, and an eighth of the float64 payload
+        # sent to the browser.
+        levels = np.log1p(counts)
+        peak = levels.max()
+        # No systems selected: leave all bins at zero
+        if peak > 0:
+            levels *= 255.0 / peak
+        levels = np.rint(levels).astype(np.uint8)
+        # histogram2d indexes bins as [x, z], while images are [row, column]
+        return px.imshow(
+            levels.T,
+            x=_bin_centers(x_edges),
+            y=_bin_centers(z_edges),
+            origin="lower",
+            aspect="auto",
+            color_continuous_scale="Viridis",
+            zmin=0,
+            zmax=255,
+            labels={"x": "coords.x", "y": "coords.z", "color": "log density"},
+        )
+
     def display(self):
-        """Display a heatmap with the currently selected systems."""
+        """Display a heatmap with the currently selected systems.
+
+        Colors are log-scaled with the number of systems in each bin."""
         self._logger.log("Creating heatmap...")
-        # Harcoded number of X and Y bins to avoid rendering charts too large
-        px.density_heatmap(
-            self._selected_systems, x="coords.x", y="coords.z", nbinsx=1000, nbinsy=1000
-        ).show()
+        self._heatmap().show()
         self._logger.log("Heatmap displayed in a new browser window")
 
     def save(self, filename: str):
-        """Save a heatmap with the currently selected systemsto file."""
+        """Save a heatmap with the currently selected systems to file.
+
+        Colors are log-scaled with the number of systems in each bin."""
         self._logger.log("Saving heatmap to %s..." % filename)
-        # Harcoded number of X and Y bins to avoid rendering charts too large
-        px.density_heatmap(
-            self._selected_systems, x="coords.x", y="coords.z", nbinsx=1000, nbinsy=1000
-        ).write_html(filename)
+        self._heatmap().write_html(filename)
         self._logger.log("Heatmap saved to %s" % filename)
 
     def zoom_out(self):
         """Zoom out to select all systems."""
         self._logger.log("Zooming out...")
-        self._selected_systems = self._all_systems
+        self._selected_slice = slice(None)
+        self._selected_mask = None
+        self._selected_range = self._all_range
+        self._figure = None
         self._logger.log("Zoomed out")
 
     def zoom_in(self, coord_0: Tuple[int, int], coord_1: Tuple[int, int]):
@@ -74,14 +267,31 @@ class Systems:
                 coord_1[1],
             )
         )
-        min_x = min(coord_0[0], coord_1[0])
-        max_x = max(coord_0[0], coord_1[0])
-        min_z = min(coord_0[1], coord_1[1])
-        max_z = max(coord_0[1], coord_1[1])
-        self._selected_systems = (
-            self._all_systems.query(f"`coords.x` > {min_x}")
-            .query(f"`coords.x` < {max_x}")
-            .query(f"`coords.z` > {min_z}")
-            .query(f"`coords.z` < {max_z}")
+        # Work on floats from here on, like the coordinates themselves:
+        # arbitrarily large integers would not fit the numba kernels.
+        try:
+            min_x = float(min(coord_0[0], coord_1[0]))
+            max_x = float(max(coord_0[0], coord_1[0]))
+            min_z = float(min(coord_0[1], coord_1[1]))
+            max_z = float(max(coord_0[1], coord_1[1]))
+        except OverflowError as e:
+            self._logger.log("Zoom in failed, coordinates out of range: %s" % e)
+            return
+        # Only systems in this Z-order range can be in the bounding box;
+        # check each of them against the actual box.
+        corners = self._zorder_code([min_x, max_x], [min_z, max_z])
+        lo = np.searchsorted(self._zorder, corners[0])
+        hi = np.searchsorted(self._zorder, corners[1], side="right")
+        self._selected_slice = slice(lo, hi)
+        self._selected_mask = _bbox_mask(
+            self._all_xs[lo:hi], self._all_zs[lo:hi], min_x, max_x, min_z, max_z
         )
-        self._logger.log("Zoom in complete")
+        # Bin the heatmap over the requested area, even if it turns out
+        # to be empty: that shows as a blank heatmap over that area.
+        self._selected_range = (min_x, max_x, min_z, max_z)
+        self._figure = None
+        selected = int(np.count_nonzero(self._selected_mask))
+        if selected == 0:
+            self._logger.log("Zoom in complete, no systems in the selected area")
+        else:
+            self._logger.log("Zoom in complete, %d systems selected" % selected)